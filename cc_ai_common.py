@@ -0,0 +1,207 @@
+# Helpers shared by prepare-commit-msg.py and keep-a-changelog.py
+
+import os
+import re
+import json
+import time
+import click
+import hashlib
+import requests
+import subprocess
+
+try:
+    # Optional, encodes the diff-heavy request body several times faster than json
+    import orjson
+except ImportError:
+    orjson = None
+
+
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+# Seconds to wait for OpenRouter before giving up on the hook
+REQUEST_TIMEOUT = 60
+
+# Bump whenever the prompts change so stale cached responses are ignored
+PROMPT_VERSION = "v1"
+CACHE_DIRNAME = ".cc-ai-cache"
+# Seconds a cached API response stays valid (7 days)
+CACHE_TTL = 7 * 24 * 60 * 60
+
+# Literal escape sequences the model sometimes returns instead of real characters
+ESCAPE_SEQUENCE_RE = re.compile(r"\\n|\\r|\\[a-zA-Z]+")
+
+# Path of the repository's git directory, set by is_git_repository()
+git_dir = None
+
+# Shared by all OpenRouter calls so the connection is pooled and kept alive
+http_session = requests.Session()
+http_session.headers.update({"Content-Type": "application/json"})
+
+
+def make_debug_log(debug):
+    def debug_log(message, content=None):
+        if debug:
+            click.echo(f"DEBUG: {message}")
+            if content:
+                if isinstance(content, bytes):
+                    content = content.decode("utf-8")
+                click.echo(f"DEBUG: Content >>>\n{content}\nDEBUG: <<<")
+
+    return debug_log
+
+
+def is_git_repository():
+    global git_dir
+    git_dir = find_git_dir()
+    return git_dir is not None
+
+
+def find_git_dir():
+    # Same lookup `git rev-parse --git-dir` does, without spawning git
+    if os.getenv("GIT_DIR"):
+        return os.path.abspath(os.getenv("GIT_DIR"))
+    directory = os.getcwd()
+    while True:
+        candidate = os.path.join(directory, ".git")
+        if os.path.isdir(candidate):
+            return candidate
+        if os.path.isfile(candidate):
+            # Worktrees and submodules point to the real git directory from a ".git" file
+            content = read_file(candidate)
+            if content.startswith("gitdir: "):
+                return os.path.normpath(os.path.join(directory, content[len("gitdir: "):].strip()))
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def run_git(*args):
+    result = subprocess.run(["git", *args], stdout=subprocess.PIPE, encoding="utf-8", errors="replace")
+    return result.stdout
+
+
+def read_file(filename):
+    try:
+        with open(filename, "r", encoding="utf-8") as file:
+            return file.read()
+    except Exception as e:
+        return ""
+
+
+def write_file(filename, content):
+    try:
+        with open(filename, "wb") as file:
+            file.write(content.encode("utf-8"))
+        return True
+    except Exception as e:
+        return False
+
+
+def get_cache_key(model, user_prompt, system_prompt):
+    # Hash the parts one by one instead of joining them into yet another copy of the diff
+    digest = hashlib.sha256(model.encode("utf-8"))
+    for part in [PROMPT_VERSION, user_prompt, system_prompt]:
+        digest.update(b"\0")
+        digest.update(part.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get_cache_filename(cache_key):
+    return os.path.join(git_dir, CACHE_DIRNAME, f"{cache_key}.json")
+
+
+def read_cache(cache_key):
+    cache_filename = get_cache_filename(cache_key)
+    try:
+        if time.time() - os.path.getmtime(cache_filename) > CACHE_TTL:
+            return None
+        with open(cache_filename, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache(cache_key, response):
+    cache_filename = get_cache_filename(cache_key)
+    temp_filename = f"{cache_filename}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_filename), exist_ok=True)
+        with open(temp_filename, "w") as file:
+            json.dump(response, file)
+        os.replace(temp_filename, cache_filename)
+    except (OSError, TypeError, ValueError):
+        return False
+    prune_cache(os.path.dirname(cache_filename))
+    return True
+
+
+def prune_cache(cache_dir):
+    now = time.time()
+    try:
+        with os.scandir(cache_dir) as entries:
+            for entry in entries:
+                if now - entry.stat().st_mtime > CACHE_TTL:
+                    os.remove(entry.path)
+    except OSError:
+        pass
+
+
+def make_api_request(model, user_prompt, system_prompt, api_key, debug_log):
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+    }
+    payload = {
+        "stream": False,
+        "transforms": ["middle-out"],
+        "model": model,
+        "messages": [
+            {"role": "user", "content": user_prompt},
+            {"role": "system", "content": system_prompt},
+        ],
+    }
+
+    # Serialize once; passing json= would make requests encode the whole diff again
+    if orjson:
+        body = orjson.dumps(payload)
+    else:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    debug_log("Making API request to OpenRouter", body)
+
+    try:
+        response = http_session.post(OPENROUTER_URL, headers=headers, data=body, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        response_json = orjson.loads(response.content) if orjson else response.json()
+        debug_log("API response received", response_json)
+        return response_json
+    except (requests.RequestException, ValueError) as e:
+        debug_log(f"ERROR: API request failed with error: {e}")
+        return None
+
+
+def get_response_content(response):
+    if isinstance(response, (str, bytes)):
+        try:
+            response = json.loads(response)
+        except ValueError:
+            return None
+
+    try:
+        content = response["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return None
+    if not isinstance(content, str):
+        return None
+    return content
+
+
+def replace_escape_sequence(match):
+    return "\n" if match.group() == "\\n" else ""
+
+
+def clean_llm_text(text):
+    # 1. Preserve the structure of the message
+    # 2. Clean up escape sequences
+    if "\\" in text:
+        text = ESCAPE_SEQUENCE_RE.sub(replace_escape_sequence, text)
+    return text.strip()
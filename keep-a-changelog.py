@@ -1,19 +1,32 @@
 #!/usr/bin/env python3
 
 import os
-import re
-import json
 import click
-import requests
-import subprocess
 
+from cc_ai_common import (
+    OPENROUTER_API_KEY,
+    clean_llm_text,
+    get_cache_key,
+    get_response_content,
+    is_git_repository,
+    make_api_request,
+    make_debug_log,
+    read_cache,
+    read_file,
+    run_git,
+    write_cache,
+    write_file,
+)
 
-USER_PROMPT = """I want to update my CHANGELOG.md file following Keep a Changelog format.
+
+USER_PROMPT_PREFIX = """I want to update my CHANGELOG.md file following Keep a Changelog format.
 
 Ensure the release notes are appended below previous entries and use the Keep a Changelog format. If the file doesn't exist, create it.
 
 ```
-{}
+"""
+
+USER_PROMPT_SUFFIX = """
 ```
 
 IMPORTANT:
@@ -26,7 +39,7 @@ IMPORTANT:
   - Append new entries at the end of the file and that's it.
 """
 
-SYSTEM_PROMPT = """You are an AI assistant tasked with maintaining a CHANGELOG.md file for a software project.
+SYSTEM_PROMPT_PREFIX = """You are an AI assistant tasked with maintaining a CHANGELOG.md file for a software project.
 
 The output should meet the following criteria:
 
@@ -69,7 +82,9 @@ IMPORTANT:
 
 Here is the output from `git diff --cached`:
 ```
-{}
+"""
+
+SYSTEM_PROMPT_SUFFIX = """
 ```
 """
 
@@ -77,13 +92,10 @@ Here is the output from `git diff --cached`:
 @click.option('--debug', is_flag=True, help='Enable debug logging.')
 @click.option('--model', default='google/gemini-flash-1.5-8b', help='Select AI model.')
 @click.option('--changelog-filename', default='CHANGELOG.md', help='Filename of the changelog.')
-def main(debug, model, changelog_filename):
+@click.option('--no-cache', is_flag=True, help='Always call the API instead of reusing a cached response.')
+def main(debug, model, changelog_filename, no_cache):
 
-    def debug_log(message, content=None):
-        if debug:
-            click.echo(f"DEBUG: {message}")
-            if content:
-                click.echo(f"DEBUG: Content >>>\n{content}\nDEBUG: <<<")
+    debug_log = make_debug_log(debug)
 
     debug_log("Script started")
     debug_log(f"MODEL={model}")
@@ -93,29 +105,35 @@ def main(debug, model, changelog_filename):
         click.echo("ERROR: Not in a git repository", err=True)
         return
 
-    if is_changelog_staged(changelog_filename):
+    staged_filenames, changes = get_staged_changes()
+    if os.path.normpath(changelog_filename) in staged_filenames:
         click.echo(f"INFO: Skipping {changelog_filename} update")
         return
 
-    changes = get_git_diff()
     if not changes:
         click.echo("INFO: No staged changes found. Please stage your changes using 'git add' first.")
         return
 
-    current_changelog = read_file(changelog_filename) if os.path.isfile(changelog_filename) else ""
+    # read_file() returns "" for a missing changelog, no need to stat it first
+    current_changelog = read_file(changelog_filename)
 
-    user_prompt = USER_PROMPT.format(changes)
-    system_prompt = SYSTEM_PROMPT.format(current_changelog)
+    user_prompt = f"{USER_PROMPT_PREFIX}{changes}{USER_PROMPT_SUFFIX}"
+    system_prompt = f"{SYSTEM_PROMPT_PREFIX}{current_changelog}{SYSTEM_PROMPT_SUFFIX}"
 
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    if not api_key:
-        click.echo("ERROR: No API key found. Please provide the OpenRouter API key as an argument or set the OPENROUTER_API_KEY environment variable.", err=True)
-        return
-  
-    response = make_api_request(model, user_prompt, system_prompt, api_key, debug_log)
-    if not response:
-        click.echo("ERROR: Failed to generate release notes.", err=True)
-        return
+    cache_key = get_cache_key(model, user_prompt, system_prompt)
+    response = None if no_cache else read_cache(cache_key)
+    cache_hit = bool(response)
+    if cache_hit:
+        debug_log(f"Using cached API response {cache_key}")
+    else:
+        if not OPENROUTER_API_KEY:
+            click.echo("ERROR: No API key found. Please provide the OpenRouter API key as an argument or set the OPENROUTER_API_KEY environment variable.", err=True)
+            return
+
+        response = make_api_request(model, user_prompt, system_prompt, OPENROUTER_API_KEY, debug_log)
+        if not response:
+            click.echo("ERROR: Failed to generate release notes.", err=True)
+            return
 
     # Extract and clean the commit message
     # First, try to parse the response as JSON and extract the content
@@ -124,6 +142,9 @@ def main(debug, model, changelog_filename):
         click.echo("ERROR: Failed to extract release notes from API response.", err=True)
         return
 
+    if not cache_hit and not write_cache(cache_key, response):
+        debug_log(f"Failed to cache API response {cache_key}")
+
     if not write_file(changelog_filename, generated_changelog):
         click.echo(f"ERROR: Failed to write to {changelog_filename}", err=True)
         return
@@ -131,85 +152,33 @@ def main(debug, model, changelog_filename):
     click.echo(f"Release notes successfully written to {changelog_filename}")
 
 
-def is_git_repository():
-    try:
-        subprocess.run(["git", "rev-parse", "--git-dir"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-        return True
-    except subprocess.CalledProcessError:
-        return False
-
-
-def is_changelog_staged(changelog_filename):
-    result = subprocess.run(["git", "diff", "--cached", "--name-only", "--", changelog_filename], stdout=subprocess.PIPE)
-    return bool(result.stdout.strip())
-
-
-def get_git_diff():
-    result = subprocess.run(["git", "diff", "--cached", "--ignore-all-space"], stdout=subprocess.PIPE)
-    return result.stdout.decode("utf-8").strip()
-
-
-def read_file(filename):
-    try:
-        with open(filename, "r") as file:
-            return file.read()
-    except Exception as e:
-        return ""
-
-
-def write_file(filename, content):
-    try:
-        with open(filename, "w") as file:
-            file.write(content)
-        return True
-    except Exception as e:
-        return False
-
-
-def make_api_request(model, user_prompt, system_prompt, api_key, debug_log):
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "stream": False,
-        "transforms": ["middle-out"],
-        "model": model,
-        "messages": [
-            {"role": "user", "content": user_prompt},
-            {"role": "system", "content": system_prompt},
-        ],
-    }
-
-    debug_log("Making API request to OpenRouter", json.dumps(payload, indent=2))
-
-    try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        debug_log("API response received", response.json())
-        return response.json()
-    except requests.RequestException as e:
-        debug_log(f"ERROR: API request failed with error: {e}")
-        return None
+def get_staged_changes():
+    # One git call for both the staged filenames and the diff: --raw lists every staged file,
+    # including whitespace-only changes, while --ignore-all-space only applies to the patch.
+    output = run_git("diff", "--cached", "--ignore-all-space", "--raw", "-z", "--patch")
+    raw, _, diff = output.partition("\0\0")
+    return parse_staged_filenames(raw), diff.rstrip()
+
+
+def parse_staged_filenames(raw):
+    # Records look like ":<modes> <hashes> <status>\0<path>\0", renames and copies carry two paths
+    filenames = set()
+    fields = iter(raw.split("\0"))
+    for field in fields:
+        if not field.startswith(":"):
+            continue
+        filenames.add(os.path.normpath(next(fields, "")))
+        if field.split()[-1][:1] in ("R", "C"):
+            filenames.add(os.path.normpath(next(fields, "")))
+    return filenames
+
 
 def extract_generated_changelog(response, debug_log):
-    try:
-        generated_changelog = response["choices"][0]["message"]["content"]
-    except (KeyError, IndexError, TypeError):
-        # If parsing fails, fallback to regex method
-        match = re.search(r'"content":"([^"]*)"', response)
-        generated_changelog = match.group(1) if match else None
-
-    # Clean the message:
-    # 1. Preserve the structure of the commit message
-    # 2. Clean up escape sequences
-    generated_changelog = re.sub(r'\\n', '\n', generated_changelog)
-    generated_changelog = re.sub(r'\\r', '', generated_changelog)
-    generated_changelog = re.sub(r'^\s+', '', generated_changelog)
-    generated_changelog = re.sub(r'\s+$', '', generated_changelog)
-    generated_changelog = re.sub(r'\\[a-zA-Z]+', '', generated_changelog)
+    generated_changelog = get_response_content(response)
+    if generated_changelog is None:
+        return None
 
+    generated_changelog = clean_llm_text(generated_changelog)
     debug_log("Extracted relevant notes", generated_changelog)
 
     return generated_changelog
@@ -2,16 +2,31 @@
 
 import os
 import re
-import json
 import click
-import requests
-import subprocess
 
+from cc_ai_common import (
+    OPENROUTER_API_KEY,
+    clean_llm_text,
+    get_cache_key,
+    get_response_content,
+    is_git_repository,
+    make_api_request,
+    make_debug_log,
+    read_cache,
+    run_git,
+    write_cache,
+    write_file,
+)
 
-USER_PROMPT = """Generate a commit message based on the following changes below:
+
+CONVENTIONAL_COMMIT_RE = re.compile(r"^(?:feat|fix|docs|style|refactor|perf|test|build|ci|chore|revert)(?:\([^)]+\))?!?: .+")
+
+USER_PROMPT_PREFIX = """Generate a commit message based on the following changes below:
 
 ```
-{}
+"""
+
+USER_PROMPT_SUFFIX = """
 ```
 
 IMPORTANT
@@ -97,12 +112,9 @@ Commit message with multi-paragraph body and multiple footers:
 @click.option('--model', default='google/gemini-flash-1.5-8b', help='Select AI model.')
 @click.option('--commit-msg-filename', required=True, help='Path to the commit message file.')
 @click.option('--open-source', is_flag=True, help='Send complete diff instead of just filenames')
-def main(debug, model, commit_msg_filename, open_source):
-    def debug_log(message, content=None):
-        if debug:
-            click.echo(f"DEBUG: {message}")
-            if content:
-                click.echo(f"DEBUG: Content >>>\n{content}\nDEBUG: <<<")
+@click.option('--no-cache', is_flag=True, help='Always call the API instead of reusing a cached response.')
+def main(debug, model, commit_msg_filename, open_source, no_cache):
+    debug_log = make_debug_log(debug)
 
     debug_log(f"MODEL={model}")
     debug_log(f"COMMIT_MSG_FILENAME={commit_msg_filename}")
@@ -112,10 +124,7 @@ def main(debug, model, commit_msg_filename, open_source):
         return
 
     debug_log("Getting git changes")
-    if open_source:
-        changes = subprocess.run(["git", "diff", "--cached", "--ignore-all-space"], stdout=subprocess.PIPE)
-    else:
-        changes = subprocess.run(["git", "diff", "--cached", "--name-status", "--ignore-all-space"], stdout=subprocess.PIPE)
+    changes = get_git_diff(open_source)
 
     if not changes:
         click.echo("INFO: No staged changes found. Please stage your changes using 'git add' first.")
@@ -123,15 +132,20 @@ def main(debug, model, commit_msg_filename, open_source):
     
     debug_log("Script started")
 
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    if not api_key:
-        click.echo("ERROR: No API key found. Please provide the OpenRouter API key as an argument or set the OPENROUTER_API_KEY environment variable.", err=True)
-        return
-
-    user_prompt = USER_PROMPT.format(changes)
+    user_prompt = f"{USER_PROMPT_PREFIX}{changes}{USER_PROMPT_SUFFIX}"
     system_prompt = SYSTEM_PROMPT
-  
-    response = make_api_request(model, user_prompt, system_prompt, api_key, debug_log)
+
+    cache_key = get_cache_key(model, user_prompt, system_prompt)
+    response = None if no_cache else read_cache(cache_key)
+    cache_hit = bool(response)
+    if cache_hit:
+        debug_log(f"Using cached API response {cache_key}")
+    else:
+        if not OPENROUTER_API_KEY:
+            click.echo("ERROR: No API key found. Please provide the OpenRouter API key as an argument or set the OPENROUTER_API_KEY environment variable.", err=True)
+            return
+
+        response = make_api_request(model, user_prompt, system_prompt, OPENROUTER_API_KEY, debug_log)
 
     debug_log("API response received", response)
     
@@ -142,86 +156,65 @@ def main(debug, model, commit_msg_filename, open_source):
         click.echo("ERROR: Failed to extract commit message from API response.", err=True)
         return
 
+    if not cache_hit and not write_cache(cache_key, response):
+        debug_log(f"Failed to cache API response {cache_key}")
+
     if not validate_commit_message(commit_full):
         click.echo("ERROR: Generated message does not follow conventional commit format", err=True)
 
     # Write the commit message to .git/COMMIT_EDITMSG
-    debug_log(f"Writing commit message to {os.path.realpath(commit_msg_filename)}")
+    if debug:
+        debug_log(f"Writing commit message to {os.path.realpath(commit_msg_filename)}")
     if not write_file(commit_msg_filename, commit_full):
         click.echo("ERROR: Failed to write commit message to {}".format(commit_msg_filename), err=True)
 
 
-def is_git_repository():
-    try:
-        subprocess.run(["git", "rev-parse", "--git-dir"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-        return True
-    except subprocess.CalledProcessError:
-        return False
-
-
-def write_file(filename, content):
-    try:
-        with open(filename, "w") as file:
-            file.write(content)
-        return True
-    except Exception as e:
-        return False
-
-
-def make_api_request(model, user_prompt, system_prompt, api_key, debug_log):
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "stream": False,
-        "transforms": ["middle-out"],
-        "model": model,
-        "messages": [
-            {"role": "user", "content": user_prompt},
-            {"role": "system", "content": system_prompt},
-        ],
-    }
-
-    debug_log("Making API request to OpenRouter", json.dumps(payload, indent=2))
-
-    try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        debug_log("API response received", response.json())
-        return response.json()
-    except requests.RequestException as e:
-        debug_log(f"ERROR: API request failed with error: {e}")
-        return None
+def get_git_diff(open_source):
+    if open_source:
+        # --ignore-all-space already leaves whitespace-only changes out of the patch
+        return run_git("diff", "--cached", "--ignore-all-space").rstrip()
+    # --name-status ignores --ignore-all-space, so ask for --raw (same information) together with
+    # --numstat (which honours it) to spot whitespace-only changes without a second git call
+    return format_name_status(run_git("diff", "--cached", "--ignore-all-space", "--raw", "--numstat", "-z"))
+
+
+def format_name_status(output):
+    # --raw records ":<modes> <hashes> <status>\0<path>\0" come first, renames and copies carry two paths.
+    # The --numstat records after them only list paths with non-whitespace changes.
+    lines = []
+    has_changes = False
+    fields = iter(output.split("\0"))
+    for field in fields:
+        if field.startswith(":"):
+            status = field.split()[-1]
+            paths = [next(fields, "")]
+            if status[:1] in ("R", "C"):
+                paths.append(next(fields, ""))
+            lines.append("\t".join([status] + paths))
+        elif field:
+            has_changes = True
+            if field.endswith("\t"):
+                # Renamed or copied path, source and destination follow
+                next(fields, "")
+                next(fields, "")
+    return "\n".join(lines) if has_changes else ""
 
 
 def extract_commit_message(response, debug_log):
-    try:
-        commit_full = response["choices"][0]["message"]["content"]
-    except (KeyError, IndexError, TypeError):
-        # If parsing fails, fallback to regex method
-        match = re.search(r'"content":"([^"]*)"', response)
-        commit_full = match.group(1) if match else None
-    
-    # Clean the message:
-    # 1. Preserve the structure of the commit message
-    # 2. Clean up escape sequences
-    commit_full = re.sub(r'\\n', '\n', commit_full)
-    commit_full = re.sub(r'\\r', '', commit_full)
-    commit_full = re.sub(r'^\s+', '', commit_full)
-    commit_full = re.sub(r'\s+$', '', commit_full)
-    commit_full = re.sub(r'\\[a-zA-Z]+', '', commit_full)
+    commit_full = get_response_content(response)
+    if commit_full is None:
+        return None
 
+    commit_full = clean_llm_text(commit_full)
     debug_log("Extracted commit message ", commit_full)
-    
+
     return commit_full
 
+
 # Validate commit message format
 def validate_commit_message(message):
-    # Check if message follows conventional commit format
-    pattern = r"^(feat|fix|docs|style|refactor|perf|test|build|ci|chore|revert)(\(.+\))?: .+$"
-    if not re.match(pattern, message):
+    # Check if the title line follows conventional commit format
+    if not CONVENTIONAL_COMMIT_RE.match(message.split("\n", 1)[0]):
         return False
     return True
 
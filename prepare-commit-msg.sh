@@ -288,7 +288,7 @@ fi
 validate_commit_message() {
     local message="$1"
     # Check if message follows conventional commit format
-    if ! echo "$message" | grep -qE '^(feat|fix|docs|style|refactor|perf|test|build|ci|chore|revert)(\(.+\))?: .+'; then
+    if ! echo "$message" | grep -qE '^(feat|fix|docs|style|refactor|perf|test|build|ci|chore|revert)(\([^)]+\))?!?: .+'; then
         return 1
     fi
     return 0